@@ -3,9 +3,29 @@ import openai
 from openai import OpenAI
 import yfinance as yf
 import json
-import time
+import logging
+import re
 import os
+import string
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import TimeoutError as FuturesTimeoutError
 from dotenv import load_dotenv
+from tenacity import (
+    retry,
+    retry_if_exception_type,
+    stop_after_attempt,
+    wait_exponential,
+)
+
+# Debug logging, enabled with CHATBOT_LOG_LEVEL=DEBUG (the handler is only added
+# once, since Streamlit re-executes this module on every rerun)
+logger = logging.getLogger(__name__)
+log_level = os.environ.get("CHATBOT_LOG_LEVEL", "WARNING").upper()
+if not isinstance(logging.getLevelName(log_level), int):
+    log_level = "WARNING"  # Unknown level names must not break the app
+logger.setLevel(log_level)
+if not logger.handlers:
+    logger.addHandler(logging.StreamHandler())
 
 
 # Function to determine the API key source
@@ -21,20 +41,127 @@ def get_api_key():
         return api_key
 
 
+# Create the OpenAI client once per server process so its connection pool
+# survives Streamlit reruns
+@st.cache_resource
+def get_openai_client():
+    return OpenAI(api_key=get_api_key())
+
+
 # Initialize OpenAI client
-client = OpenAI(api_key=get_api_key())
+client = get_openai_client()
+
+
+# Retry transient OpenAI/Yahoo failures (rate limits, timeouts, 5xx) with
+# exponential backoff, giving up after 3 attempts
+retry_openai = retry(
+    stop=stop_after_attempt(3),
+    wait=wait_exponential(multiplier=1, min=1, max=10),
+    retry=retry_if_exception_type(
+        (
+            openai.RateLimitError,
+            openai.APITimeoutError,
+            openai.APIConnectionError,
+            openai.InternalServerError,
+        )
+    ),
+    reraise=True,
+)
+retry_yahoo = retry(
+    stop=stop_after_attempt(3),
+    wait=wait_exponential(multiplier=1, min=1, max=10),
+    retry=retry_if_exception_type(yf.exceptions.YFRateLimitError),
+    reraise=True,
+)
+
+
+# Call the OpenAI Responses API, retrying transient errors
+@retry_openai
+def create_response(**kwargs):
+    return client.responses.create(**kwargs)
+
+
+# Fetch latest closing price, cached briefly so repeat queries skip Yahoo
+# (failures raise and are therefore never cached)
+@st.cache_data(ttl=60, show_spinner=False)
+@retry_yahoo
+def fetch_stock_price(ticker):
+    stock = yf.Ticker(ticker.upper())
+    history = stock.history(period="1d")
+    if history.empty:
+        raise ValueError("no price data")
+    return round(float(history["Close"].iloc[-1]), 2)
 
 
 # Function to get stock price by ticker
 def get_stock_price(ticker):
     try:
-        stock = yf.Ticker(ticker.upper())
-        price = stock.history(period="1d")["Close"].iloc[-1]
-        return round(price, 2)
+        return fetch_stock_price(ticker)
     except Exception as e:
         return f"Error fetching price for {ticker}: {str(e)}"
 
 
+# Raised when a batch download misses some symbols, carrying the prices it did get
+class MissingPricesError(Exception):
+    def __init__(self, prices, missing):
+        super().__init__(f"No price data for {', '.join(missing)}")
+        self.prices = prices
+
+
+# Fetch latest closing prices for several symbols in one Yahoo request.
+# yf.download swallows per-symbol errors (including rate limits), so an
+# incomplete result raises MissingPricesError instead of being cached.
+@st.cache_data(ttl=60, show_spinner=False)
+def fetch_stock_prices(symbols):
+    data = yf.download(
+        list(symbols),
+        period="1d",
+        group_by="ticker",
+        threads=True,
+        progress=False,
+    )
+    prices = {}
+    for symbol in symbols:
+        if symbol in data.columns.get_level_values(0):
+            closes = data[symbol]["Close"].dropna()
+            if not closes.empty:
+                prices[symbol] = round(float(closes.iloc[-1]), 2)
+    missing = [symbol for symbol in symbols if symbol not in prices]
+    if missing:
+        raise MissingPricesError(prices, missing)
+    return prices
+
+
+# Function to get stock prices for several tickers, falling back to concurrent
+# single-ticker lookups for any the batch request missed
+def get_stock_prices(tickers):
+    try:
+        prices = fetch_stock_prices(tuple(ticker.upper() for ticker in tickers))
+    except MissingPricesError as e:
+        prices = e.prices
+    except Exception:
+        prices = {}
+    missed = [ticker for ticker in tickers if ticker.upper() not in prices]
+    if missed:
+        with ThreadPoolExecutor(max_workers=min(8, len(missed))) as executor:
+            prices.update(
+                zip(
+                    (ticker.upper() for ticker in missed),
+                    executor.map(get_stock_price, missed),
+                )
+            )
+    return {ticker: prices[ticker.upper()] for ticker in tickers}
+
+
+# Check whether a symbol is a valid ticker (cached for a day, symbols rarely change;
+# lookup failures raise and are therefore never cached)
+@st.cache_data(ttl=86400, show_spinner=False)
+@retry_yahoo
+def is_valid_ticker(symbol):
+    info = yf.Ticker(symbol.upper()).info
+    return bool(info) and "symbol" in info
+
+
 # Function specification for OpenAI Responses API
 stock_price_function = {
     "type": "function",
@@ -54,20 +181,23 @@ stock_price_function = {
 }
 
 
-# Check if query is related to stocks/crypto/trading
-def is_related_to_stocks_crypto(query):
-    # Existing keywords
-    keywords = [
+# Direct financial keywords. Matched as word prefixes (see compile_term_pattern),
+# so "prices", "investing" or "bitcoins" are covered by their stems.
+financial_keywords = frozenset(
+    {
         "stock",
-        "stocks",
         "crypto",
-        "cryptocurrency",
         "trade",
         "trading",
         "market",
         "price",
+        "pricing",
         "invest",
-        "investment",
+        "reinvest",
+        "premarket",
+        "aftermarket",
+        "overpriced",
+        "underpriced",
         "bitcoin",
         "ethereum",
         "portfolio",
@@ -75,50 +205,34 @@ def is_related_to_stocks_crypto(query):
         "bear",
         "exchange",
         "gold",
-        "XAUUSD",
-    ]
+        "xauusd",
+    }
+)
 
-    # Add company/business-related keywords
-    company_keywords = [
+# Company/business-related keywords
+company_keywords = frozenset(
+    {
         "company",
+        "companies",
         "business",
         "corporation",
         "inc",
+        "incorporated",
         "ltd",
         "information",
         "operations",
         "industry",
+        "industries",
         "revenue",
-        "products",
-        "services",
-    ]
-
-    query_lower = query.lower()
-
-    # Check for direct financial keywords
-    if any(keyword in query_lower for keyword in keywords):
-        return True
-
-    # Check for company-related keywords
-    if any(keyword in query_lower for keyword in company_keywords):
-        # Extract potential company names (simple heuristic: capitalized words)
-        words = query.split()
-        potential_companies = [
-            word for word in words if word[0].isupper() and len(word) > 2
-        ]
+        "income",
+        "product",
+        "service",
+    }
+)
 
-        # Check if any potential company name has a valid stock ticker
-        for company in potential_companies:
-            try:
-                ticker = yf.Ticker(company.upper())  # Try as a ticker symbol
-                if ticker.info and "symbol" in ticker.info:  # Valid ticker
-                    return True
-            except Exception:
-                # If not a ticker, check a predefined list or skip
-                pass
-
-    # Add a small list of well-known companies with stocks (optional fallback)
-    known_companies = [
+# A small set of well-known companies with stocks (fallback)
+known_companies = frozenset(
+    {
         "tesla",
         "apple",
         "microsoft",
@@ -133,101 +247,180 @@ def is_related_to_stocks_crypto(query):
         "gm",
         "boeing",
         "hp",
-    ]
+    }
+)
+
+
+# Compile terms into one case-insensitive pattern. Terms match at the start of a
+# word ("price" matches "priced"); terms of up to 3 letters must be the whole
+# word, so "inc" does not match "since" and "gm" does not match "gmail".
+def compile_term_pattern(terms):
+    prefixes = "|".join(
+        sorted((re.escape(t) for t in terms if len(t) > 3), key=len, reverse=True)
+    )
+    words = "|".join(sorted(re.escape(t) for t in terms if len(t) <= 3))
+    return re.compile(rf"\b(?:{prefixes})|\b(?:{words})\b", re.IGNORECASE)
+
+
+# Financial keywords and well-known company names both mark a query as on-topic
+financial_pattern = compile_term_pattern(financial_keywords | known_companies)
+company_pattern = compile_term_pattern(company_keywords)
+
+# Maps punctuation to spaces so a single split() yields clean words
+punctuation_table = str.maketrans(string.punctuation, " " * len(string.punctuation))
+
+
+# Seconds to wait for ticker probes before treating the remaining ones as misses
+# (yfinance hard-codes its own 30s request timeout and offers no setting for it)
+ticker_probe_timeout = 5
+
+
+# Check if query is related to stocks/crypto/trading
+def is_related_to_stocks_crypto(query):
+    # Strip punctuation once and reuse the text for every check below
+    text = query.translate(punctuation_table)
 
-    if any(company in query_lower for company in known_companies):
+    # Check for direct financial keywords or well-known company names
+    if financial_pattern.search(text):
         return True
 
+    # Check for company-related keywords
+    if company_pattern.search(text):
+        # Extract potential company names (simple heuristic: capitalized words)
+        words = text.split()
+        potential_companies = list(
+            dict.fromkeys(word for word in words if word[0].isupper() and len(word) > 2)
+        )
+
+        # Check if any potential company name has a valid stock ticker,
+        # probing candidates concurrently and stopping at the first hit
+        if potential_companies:
+            executor = ThreadPoolExecutor(max_workers=min(8, len(potential_companies)))
+            try:
+                futures = [
+                    executor.submit(is_valid_ticker, company)  # Try as a ticker symbol
+                    for company in potential_companies
+                ]
+                for future in as_completed(futures, timeout=ticker_probe_timeout):
+                    try:
+                        if future.result():
+                            return True
+                    except Exception:
+                        # Lookup failed; treat the candidate as not a ticker
+                        continue
+            except FuturesTimeoutError:
+                # Probes still running past the deadline count as misses
+                logger.debug("Ticker probes timed out for %r", query)
+            finally:
+                executor.shutdown(wait=False, cancel_futures=True)
+
     return False
 
 
+# Inline Markdown patterns: bold (**text** or __text__), italics (*text* or _text_)
+bold_pattern = re.compile(r"\*\*(.+?)\*\*|__(.+?)__")
+italic_pattern = re.compile(
+    r"(?<!\*)\*(?!\*)(.+?)(?<!\*)\*(?!\*)|(?<!_)_(?!_)(.+?)(?<!_)_(?!_)"
+)
+
+
+# Replace a bold/italic match with the given HTML tag around its inner text
+def wrap_match(tag):
+    return lambda match: f"<{tag}>{match.group(1) or match.group(2)}</{tag}>"
+
+
+wrap_bold = wrap_match("b")
+wrap_italic = wrap_match("i")
+
+
+# Function to process text with Markdown-like formatting
+def process_text(text):
+    # Split text into lines for processing
+    lines = text.split("\n")
+    processed_lines = []
+
+    for line in lines:
+        if not line.strip():
+            # Preserve empty lines as breaks
+            processed_lines.append("<br>")
+            continue
+
+        # Handle headings
+        if line.startswith("### "):
+            line = f"<h3>{line[4:].strip()}</h3>"
+        elif line.startswith("## "):
+            line = f"<h2>{line[3:].strip()}</h2>"
+        elif line.startswith("# "):
+            line = f"<h1>{line[2:].strip()}</h1>"
+        else:
+            # Wrap non-heading lines in a paragraph tag for consistency
+            line = f"<p>{line.strip()}</p>"
+
+        # Process inline Markdown within the line in a single pass per style
+        line = bold_pattern.sub(wrap_bold, line)
+        line = italic_pattern.sub(wrap_italic, line)
+
+        processed_lines.append(line)
+
+    # Join lines with breaks where needed
+    return "".join(processed_lines)
+
+
+# Prompt templates, built once; only the per-request parts are filled in.
+# Keeping the fixed text identical across requests also lets OpenAI reuse
+# cached prompt prefixes.
+system_prompt = "System: You are a financial assistant specializing in stocks, cryptocurrency, and trading."
+initial_prompt_template = (
+    system_prompt
+    + " Use the get_stock_price function when asked for a stock price. Provide a clear comparison when asked about multiple stocks.\n\nUser: {query}"
+)
+follow_up_prompt_template = (
+    system_prompt
+    + " The user asked: '{query}'. Using the tool results below, provide a concise text response summarizing the information. Do not invoke additional tool calls unless explicitly requested.\n\nTool results:\n{tool_results}\n\nNow, respond to the user with the stock prices in a clear, natural language format."
+)
+batch_prompt_template = (
+    system_prompt
+    + " Answer each numbered user query below. Return only a JSON array of strings, one answer per query, in the same order.\n\n{queries}"
+)
+single_query_prompt_template = system_prompt + "\n\nUser: {query}"
+
+# Reply used for queries outside the chatbot's scope
+off_topic_message = "I can only answer questions about stocks, cryptocurrency, or trading. Please ask about one of those topics!"
+
+
 # Streaming response generator with function calling
 def response_generator(query):
     if not is_related_to_stocks_crypto(query):
-        for (
-            word
-        ) in "I can only answer questions about stocks, cryptocurrency, or trading. Please ask about one of those topics!".split():
-            yield word + " "
-            time.sleep(0.1)
+        yield off_topic_message
         return
 
     # Initial call to LLM
-    response = client.responses.create(
+    response = create_response(
         model="gpt-4o-mini",
-        input=f"System: You are a financial assistant specializing in stocks, cryptocurrency, and trading. Use the get_stock_price function when asked for a stock price. Provide a clear comparison when asked about multiple stocks.\n\nUser: {query}",
+        input=initial_prompt_template.format(query=query),
         tools=[stock_price_function],
         stream=False,
     )
-    print("First Response: " + str(response.output))
-    print("-" * 60)
+    logger.debug("First Response: %s", response.output)
 
     # Check if response contains output
     if not response.output or len(response.output) == 0:
-        for word in "No response received from the API".split():
-            yield word + " "
-            time.sleep(0.1)
+        yield "No response received from the API"
         return
 
-    # Function to process text with Markdown-like formatting
-    # Function to process text with Markdown-like formatting
-    def process_text(text):
-        # Split text into lines for processing
-        lines = text.split("\n")
-        processed_lines = []
-
-        for line in lines:
-            if not line.strip():
-                # Preserve empty lines as breaks
-                processed_lines.append("<br>")
-                continue
-
-            # Handle headings
-            if line.startswith("### "):
-                line = f"<h3>{line[4:].strip()}</h3>"
-            elif line.startswith("## "):
-                line = f"<h2>{line[3:].strip()}</h2>"
-            elif line.startswith("# "):
-                line = f"<h1>{line[2:].strip()}</h1>"
-            else:
-                # Wrap non-heading lines in a paragraph tag for consistency
-                line = f"<p>{line.strip()}</p>"
-
-            # Process inline Markdown within the line
-            # Bold (**text** or __text__)
-            while "**" in line:
-                line = line.replace("**", "<b>", 1).replace("**", "</b>", 1)
-            while "__" in line:
-                line = line.replace("__", "<b>", 1).replace("__", "</b>", 1)
-
-            # Italics (*text* or _text_)
-            while "*" in line and line.count("*") >= 2:
-                line = line.replace("*", "<i>", 1).replace("*", "</i>", 1)
-            while (
-                "_" in line and line.count("_") >= 2 and "__" not in line
-            ):  # Avoid conflict with bold
-                line = line.replace("_", "<i>", 1).replace("_", "</i>", 1)
-
-            processed_lines.append(line)
-
-        # Join lines with breaks where needed
-        return "".join(processed_lines)
-
-    # Handle multiple tool calls
-    tool_calls = [
-        output
-        for output in response.output
-        if hasattr(output, "type") and output.type == "function_call"
-    ]
+    # Handle multiple tool calls, collecting requested tickers in one pass
+    has_tool_calls = False
+    tickers = {}  # dict keeps first-seen order while dropping duplicates
+    for output in response.output:
+        if getattr(output, "type", None) != "function_call":
+            continue
+        has_tool_calls = True
+        if output.name == "get_stock_price":
+            tickers[json.loads(output.arguments)["ticker"]] = None
 
-    if tool_calls:
-        # Process all stock prices
-        stock_prices = {}
-        for tool_call in tool_calls:
-            if tool_call.name == "get_stock_price":
-                args = json.loads(tool_call.arguments)
-                ticker = args["ticker"]
-                price = get_stock_price(ticker)
-                stock_prices[ticker] = price
+    if has_tool_calls:
+        # Process all stock prices with a single batched fetch
+        stock_prices = get_stock_prices(list(tickers)) if tickers else {}
 
         # Prepare tool results for follow-up
         tool_results = "\n".join(
@@ -238,41 +431,36 @@ def response_generator(query):
         )
 
         # Follow-up call with explicit instruction to summarize results
-        follow_up_response = client.responses.create(
+        follow_up_response = create_response(
             model="gpt-4o-mini",
-            input=f"System: You are a financial assistant specializing in stocks, cryptocurrency, and trading. The user asked: '{query}'. Using the tool results below, provide a concise text response summarizing the information. Do not invoke additional tool calls unless explicitly requested.\n\nTool results:\n{tool_results}\n\nNow, respond to the user with the stock prices in a clear, natural language format.",
+            input=follow_up_prompt_template.format(
+                query=query, tool_results=tool_results
+            ),
             tools=[
                 stock_price_function
             ],  # Still provide tools in case they're needed later
-            stream=False,
-        )
-        print("Follow-up Response: " + str(follow_up_response))
-        print("-" * 60)
-        print(
-            f"System: You are a financial assistant specializing in stocks, cryptocurrency, and trading.\n\nUser: {query}\n\nTool results:\n{tool_results}"
+            stream=True,
         )
-        print("-" * 60)
-
-        # Handle follow-up response
-        if (
-            follow_up_response.output
-            and len(follow_up_response.output) > 0
-            and hasattr(follow_up_response.output[0], "content")
-            and len(follow_up_response.output[0].content) > 0
-        ):
-            raw_text = follow_up_response.output[0].content[0].text
-            formatted_text = process_text(raw_text)
-            words = formatted_text.split(" ")
-            for word in words:
-                yield word + " "
-                time.sleep(0.1)
+        logger.debug("Tool results for %r:\n%s", query, tool_results)
+
+        # Stream the follow-up response, formatting each line once it is complete
+        received_text = False
+        pending = ""
+        for event in follow_up_response:
+            if event.type == "response.output_text.delta":
+                received_text = True
+                pending += event.delta
+                while "\n" in pending:
+                    line, pending = pending.split("\n", 1)
+                    yield process_text(line)
+            elif event.type == "response.completed":
+                logger.debug("Follow-up Response: %s", event.response)
+
+        if received_text:
+            yield process_text(pending)
         else:
             # Fallback: If no text response, yield the tool results directly
-            formatted_text = process_text(tool_results)
-            words = formatted_text.split(" ")
-            for word in words:
-                yield word + " "
-                time.sleep(0.1)
+            yield process_text(tool_results)
     # Check if it's a direct response (ResponseOutputMessage)
     elif (
         hasattr(response.output[0], "content")
@@ -280,15 +468,70 @@ def response_generator(query):
         and hasattr(response.output[0].content[0], "text")
     ):
         raw_text = response.output[0].content[0].text
-        formatted_text = process_text(raw_text)
-        words = formatted_text.split(" ")
-        for word in words:
-            yield word + " "
-            time.sleep(0.1)
+        yield process_text(raw_text)
     else:
-        for word in "Error: Unable to process the response".split():
-            yield word + " "
-            time.sleep(0.1)
+        yield "Error: Unable to process the response"
+
+
+# Answer several queries with a single LLM call (for backfills, evaluation or
+# cache warm-up; no tool calls, so answers do not include live prices)
+def batch_responses(queries):
+    answers = [
+        None if is_related_to_stocks_crypto(q) else off_topic_message for q in queries
+    ]
+    pending = [i for i, answer in enumerate(answers) if answer is None]
+    if not pending:
+        return answers
+
+    numbered = "\n".join(f"{n}. {queries[i]}" for n, i in enumerate(pending, 1))
+    response = create_response(
+        model="gpt-4o-mini",
+        input=batch_prompt_template.format(queries=numbered),
+    )
+
+    try:
+        raw_text = response.output_text.strip()
+        if raw_text.startswith("```"):
+            # Strip a Markdown code fence around the JSON
+            raw_text = raw_text.strip("`").removeprefix("json").strip()
+        batch_answers = json.loads(raw_text)
+        if not isinstance(batch_answers, list) or len(batch_answers) != len(pending):
+            raise ValueError("expected one answer per query")
+    except ValueError:
+        batch_answers = ["Error: Unable to process the response"] * len(pending)
+
+    for i, answer in zip(pending, batch_answers):
+        answers[i] = str(answer)
+    return answers
+
+
+# Submit queries as an offline OpenAI Batch job (cheaper, completes within 24h);
+# returns the batch id to poll with client.batches.retrieve
+def submit_batch_job(queries):
+    requests_jsonl = "\n".join(
+        json.dumps(
+            {
+                "custom_id": f"query-{i}",
+                "method": "POST",
+                "url": "/v1/responses",
+                "body": {
+                    "model": "gpt-4o-mini",
+                    "input": single_query_prompt_template.format(query=query),
+                },
+            }
+        )
+        for i, query in enumerate(queries)
+    )
+    batch_file = client.files.create(
+        file=("batch_queries.jsonl", requests_jsonl.encode("utf-8")),
+        purpose="batch",
+    )
+    batch = client.batches.create(
+        input_file_id=batch_file.id,
+        endpoint="/v1/responses",
+        completion_window="24h",
+    )
+    return batch.id
 
 
 # Chatbot state initialization
@@ -297,9 +540,8 @@ def init_chatbot_state():
         st.session_state.messages = []
 
 
-# Load chat CSS
-def load_chat_css():
-    chat_css = """
+# Chat CSS
+chat_css = """
     <style>
     .chat-container {
         max-width: 600px;
@@ -396,19 +638,27 @@ def load_chat_css():
         color: rgb(64, 64, 64);
     }
     </style>
-    """
+"""
+
+
+# Load chat CSS (Streamlit rebuilds the page on every rerun, so it is emitted each run)
+def load_chat_css():
     st.markdown(chat_css, unsafe_allow_html=True)
 
 
 # Chat icon SVGs
+user_icon_svg = """<svg xmlns="http://www.w3.org/2000/svg" width="24" height="24" viewBox="0 0 24 24"><path fill="currentColor" d="M12 4a3.5 3.5 0 1 0 0 7a3.5 3.5 0 0 0 0-7M6.5 7.5a5.5 5.5 0 1 1 11 0a5.5 5.5 0 0 1-11 0M3 19a5 5 0 0 1 5-5h8a5 5 0 0 1 5 5v3H3zm5-3a3 3 0 0 0-3 3v1h14v-1a3 3 0 0 0-3-3z"/></svg>"""
+assistant_icon_svg = """<svg xmlns="http://www.w3.org/2000/svg" width="24" height="24" viewBox="0 0 24 24"><path fill="currentColor" d="M18.5 10.255q0 .067-.003.133A1.54 1.54 0 0 0 17.473 10q-.243 0-.473.074V5.75a.75.75 0 0 0-.75-.75h-8.5a.75.75 0 0 0-.75.75v4.505c0 .414.336.75.75.75h8.276l-.01.025l-.003.012l-.45 1.384l-.01.026l-.019.053H7.75a2.25 2.25 0 0 1-2.25-2.25V5.75A2.25 2.25 0 0 1 7.75 3.5h3.5v-.75a.75.75 0 0 1 .649-.743L12 2a.75.75 0 0 1 .743.649l.007.101l-.001.75h3.5a2.25 2.25 0 0 1 2.25 2.25zm-5.457 3.781l.112-.036H6.254a2.25 2.25 0 0 0-2.25 2.25v.907a3.75 3.75 0 0 0 1.305 2.844c1.563 1.343 3.802 2 6.691 2c2.076 0 3.817-.339 5.213-1.028a1.55 1.55 0 0 1-1.169-1.003l-.004-.012l-.03-.093c-1.086.422-2.42.636-4.01.636c-2.559 0-4.455-.556-5.713-1.638a2.25 2.25 0 0 1-.783-1.706v-.907a.75.75 0 0 1 .75-.75H12v-.003a1.54 1.54 0 0 1 1.031-1.456zM10.999 7.75a1.25 1.25 0 0 0-2.499 0a1.25 1.25 0 0 0 2.499 0m3.243-1.25a1.25 1.25 0 1 1 0 2.499a1.25 1.25 0 0 1 0-2.499m1.847 10.912a2.83 2.83 0 0 0-1.348-.955l-1.377-.448a.544.544 0 0 1 0-1.025l1.377-.448a2.84 2.84 0 0 0 1.76-1.762l.01-.034l.449-1.377a.544.544 0 0 1 1.026 0l.448 1.377a2.84 2.84 0 0 0 1.798 1.796l1.378.448l.027.007a.544.544 0 0 1 0 1.025l-1.378.448a2.84 2.84 0 0 0-1.798 1.796l-.447 1.377a.55.55 0 0 1-.2.263a.544.544 0 0 1-.827-.263l-.448-1.377a2.8 2.8 0 0 0-.45-.848m7.694 3.801l-.765-.248a1.58 1.58 0 0 1-.999-.998l-.249-.765a.302.302 0 0 0-.57 0l-.249.764a1.58 1.58 0 0 1-.983.999l-.766.248a.302.302 0 0 0 0 .57l.766.249a1.58 1.58 0 0 1 .999 1.002l.248.764a.303.303 0 0 0 .57 0l.25-.764a1.58 1.58 0 0 1 .998-.999l.766-.248a.302.302 0 0 0 0-.57z"/></svg>"""
+
+
 def get_chat_icon(role):
     if role == "user":
-        return """<svg xmlns="http://www.w3.org/2000/svg" width="24" height="24" viewBox="0 0 24 24"><path fill="currentColor" d="M12 4a3.5 3.5 0 1 0 0 7a3.5 3.5 0 0 0 0-7M6.5 7.5a5.5 5.5 0 1 1 11 0a5.5 5.5 0 0 1-11 0M3 19a5 5 0 0 1 5-5h8a5 5 0 0 1 5 5v3H3zm5-3a3 3 0 0 0-3 3v1h14v-1a3 3 0 0 0-3-3z"/></svg>"""
-    return """<svg xmlns="http://www.w3.org/2000/svg" width="24" height="24" viewBox="0 0 24 24"><path fill="currentColor" d="M18.5 10.255q0 .067-.003.133A1.54 1.54 0 0 0 17.473 10q-.243 0-.473.074V5.75a.75.75 0 0 0-.75-.75h-8.5a.75.75 0 0 0-.75.75v4.505c0 .414.336.75.75.75h8.276l-.01.025l-.003.012l-.45 1.384l-.01.026l-.019.053H7.75a2.25 2.25 0 0 1-2.25-2.25V5.75A2.25 2.25 0 0 1 7.75 3.5h3.5v-.75a.75.75 0 0 1 .649-.743L12 2a.75.75 0 0 1 .743.649l.007.101l-.001.75h3.5a2.25 2.25 0 0 1 2.25 2.25zm-5.457 3.781l.112-.036H6.254a2.25 2.25 0 0 0-2.25 2.25v.907a3.75 3.75 0 0 0 1.305 2.844c1.563 1.343 3.802 2 6.691 2c2.076 0 3.817-.339 5.213-1.028a1.55 1.55 0 0 1-1.169-1.003l-.004-.012l-.03-.093c-1.086.422-2.42.636-4.01.636c-2.559 0-4.455-.556-5.713-1.638a2.25 2.25 0 0 1-.783-1.706v-.907a.75.75 0 0 1 .75-.75H12v-.003a1.54 1.54 0 0 1 1.031-1.456zM10.999 7.75a1.25 1.25 0 0 0-2.499 0a1.25 1.25 0 0 0 2.499 0m3.243-1.25a1.25 1.25 0 1 1 0 2.499a1.25 1.25 0 0 1 0-2.499m1.847 10.912a2.83 2.83 0 0 0-1.348-.955l-1.377-.448a.544.544 0 0 1 0-1.025l1.377-.448a2.84 2.84 0 0 0 1.76-1.762l.01-.034l.449-1.377a.544.544 0 0 1 1.026 0l.448 1.377a2.84 2.84 0 0 0 1.798 1.796l1.378.448l.027.007a.544.544 0 0 1 0 1.025l-1.378.448a2.84 2.84 0 0 0-1.798 1.796l-.447 1.377a.55.55 0 0 1-.2.263a.544.544 0 0 1-.827-.263l-.448-1.377a2.8 2.8 0 0 0-.45-.848m7.694 3.801l-.765-.248a1.58 1.58 0 0 1-.999-.998l-.249-.765a.302.302 0 0 0-.57 0l-.249.764a1.58 1.58 0 0 1-.983.999l-.766.248a.302.302 0 0 0 0 .57l.766.249a1.58 1.58 0 0 1 .999 1.002l.248.764a.303.303 0 0 0 .57 0l.25-.764a1.58 1.58 0 0 1 .998-.999l.766-.248a.302.302 0 0 0 0-.57z"/></svg>"""
+        return user_icon_svg
+    return assistant_icon_svg
 
 
-# Create message div
-def create_message_div(role, content):
+# Build the static HTML for a message bubble, leaving {content} to fill per message
+def build_message_template(role):
     icon = get_chat_icon(role)
     chat_icon_class = f"chat-icon {'user-icon' if role == 'user' else 'assistant-icon'}"
     return f"""
@@ -417,12 +667,24 @@ def create_message_div(role, content):
             <div class="{chat_icon_class}">{icon}</div>
         </div>
         <div class="chat-bubble {'user-bubble' if role == 'user' else 'assistant-bubble'}">
-            {content}
+            {{content}}
         </div>
     </div>
     """
 
 
+message_templates = {
+    "user": build_message_template("user"),
+    "assistant": build_message_template("assistant"),
+}
+
+
+# Create message div
+def create_message_div(role, content):
+    template = message_templates["user" if role == "user" else "assistant"]
+    return template.format(content=content)
+
+
 # Main chatbot UI
 def show_chatbot_ui():
     init_chatbot_state()
@@ -445,12 +707,12 @@ def show_chatbot_ui():
         if user_query := st.chat_input("Ask about stocks, crypto, or trading:"):
             st.session_state.messages.append({"role": "user", "content": user_query})
 
+            # History is already drawn above; only the new message is added
             with messages_container:
-                for msg in st.session_state.messages:
-                    st.markdown(
-                        create_message_div(msg["role"], msg["content"]),
-                        unsafe_allow_html=True,
-                    )
+                st.markdown(
+                    create_message_div("user", user_query),
+                    unsafe_allow_html=True,
+                )
                 streaming_placeholder = st.empty()
 
             with messages_container:
@@ -476,12 +738,13 @@ def show_chatbot_ui():
             st.session_state.messages.append(
                 {"role": "assistant", "content": full_response}
             )
-            st.rerun()
 
 
-# Streamlit app
-# st.set_page_config(layout="centered")
-show_chatbot_ui()
+# Streamlit app (Streamlit runs the script as __main__; importing the module
+# for the batch helpers does not draw the UI)
+if __name__ == "__main__":
+    # st.set_page_config(layout="centered")
+    show_chatbot_ui()
 
 
 # WORKING with multiple stocks and markdown formatting